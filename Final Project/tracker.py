@@ -1,10 +1,12 @@
-import copy
-
 import numpy as np
 import torch
-from filterpy.kalman import KalmanFilter
 from scipy.optimize import linear_sum_assignment
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the greedy matching then falls back to greedy_assignment
+    njit = None
+
 NUSCENES_TRACKING_NAMES = [
     'bicycle',
     'bus',
@@ -34,6 +36,31 @@ NUSCENE_CLS_VELOCITY_ERROR = {
     'traffic_cone': 1,
 }
 
+# constant-acceleration KF over [x, y, vx, vy, ax, ay]
+_H2 = np.eye(2, 6)  # measure position
+_H4 = np.eye(4, 6)  # measure position and velocity
+_R2 = np.eye(2)
+_R4 = np.eye(4)
+_Q = np.eye(6)
+_P0 = np.eye(6) * 10  # initial covariance of a new tracklet
+_I6 = np.eye(6)
+
+
+def _build_F(time_lag):
+    return np.array([[1, 0, time_lag, 0, time_lag * time_lag, 0],
+                     [0, 1, 0, time_lag, 0, time_lag * time_lag],
+                     [0, 0, 1, 0, time_lag, 0],
+                     [0, 0, 0, 1, 0, time_lag],
+                     [0, 0, 0, 0, 1, 0],
+                     [0, 0, 0, 0, 0, 1]], np.float64)
+
+
+def _kf_init_state(track, x):
+    # start from the detected position and velocity, no acceleration
+    x[0:2] = track['ct']
+    x[2:4] = track['velocity'][:2]
+    x[4:6] = 0.0
+
 
 def greedy_assignment(dist):
     '''Greedy algorithm
@@ -45,46 +72,121 @@ def greedy_assignment(dist):
     '''
     matched_indices = []
     ### Student implement ###
-    # TODO
-    raise NotImplementedError("Greedy algorithm not implemented yet!")
+    # visit every pair once, from the closest to the farthest
+    order = np.argsort(dist, axis=None, kind='stable')
+    rows, cols = np.unravel_index(order, dist.shape)
+    used_r = np.zeros(dist.shape[0], bool)
+    used_c = np.zeros(dist.shape[1], bool)
+    remaining = min(dist.shape)
+    for r, c in zip(rows, cols):
+        if remaining == 0 or dist[r, c] > 1e16:  # everything left is invalid
+            break
+        if not used_r[r] and not used_c[c]:
+            matched_indices.append((r, c))
+            used_r[r] = True
+            used_c[c] = True
+            remaining -= 1
     ### Student implement ###
-    return np.array(matched_indices, np.int32).reshape(-1, 2)
+    return np.asarray(matched_indices, np.int32).reshape(-1, 2)
 
 
-def comparing_positions(self, positions1_data, positions2_data, positions1, positions2):
-    M = len(positions1_data)
-    N = len(positions2_data)
+def _match_greedy(positions1, positions2, positions1_cat, positions2_cat, max_diff_sq):
+    '''Gating + greedy_assignment fused, only the pairs that pass the gates are stored
 
-    positions1_cat = np.array([index['label_preds'] for index in positions1_data], np.int32)  # M pos1 labels
-    positions2_cat = np.array([index['label_preds'] for index in positions2_data], np.int32)  # N pos2 labels
-    max_diff = np.array([self.velocity_error[box['detection_name']] for box in positions2_data], np.float32)
+    Arguments:
+        positions1: M x 2 track positions, positions1_cat: M track labels
+        positions2: N x 2 detection positions, positions2_cat: N detection labels
+        max_diff_sq: N squared distance thresholds of the detections
 
-    if len(positions1) > 0:  # NOT FIRST FRAME
-        dist = (((positions1.reshape(1, -1, 2) - positions2.reshape(-1, 1, 2)) ** 2).sum(axis=2))  # N x M
-        dist = np.sqrt(dist)  # absolute distance in meter
-        invalid = ((dist > max_diff.reshape(N, 1)) + (
-                positions2_cat.reshape(N, 1) != positions1_cat.reshape(1, M))) > 0
-        dist = dist + invalid * 1e18
+    return match index (detection, track) of objects, same order as greedy_assignment
+    '''
+    M = positions1.shape[0]
+    N = positions2.shape[0]
+
+    # first pass counts the valid pairs so the candidate buffers are sized to them, not to N x M
+    K = 0
+    for i in range(N):
+        for j in range(M):
+            if positions2_cat[i] == positions1_cat[j]:
+                dx = np.float64(positions2[i, 0]) - np.float64(positions1[j, 0])
+                dy = np.float64(positions2[i, 1]) - np.float64(positions1[j, 1])
+                if dx * dx + dy * dy <= max_diff_sq[i]:
+                    K += 1
+
+    # second pass fills them in row-major order, so the stable sort below breaks ties like greedy_assignment
+    cost = np.empty(K, np.float64)
+    pair = np.empty(K, np.int64)
+    k = 0
+    for i in range(N):
+        for j in range(M):
+            if positions2_cat[i] == positions1_cat[j]:
+                dx = np.float64(positions2[i, 0]) - np.float64(positions1[j, 0])
+                dy = np.float64(positions2[i, 1]) - np.float64(positions1[j, 1])
+                d = dx * dx + dy * dy
+                if d <= max_diff_sq[i]:
+                    cost[k] = d
+                    pair[k] = i * M + j
+                    k += 1
+
+    order = np.argsort(cost, kind='mergesort')
+    used_r = np.zeros(N, np.bool_)
+    used_c = np.zeros(M, np.bool_)
+    matched_indices = np.empty((min(N, M), 2), np.int32)
+    k = 0
+    for o in order:
+        if k == matched_indices.shape[0]:
+            break
+        i = pair[o] // M
+        j = pair[o] % M
+        if not used_r[i] and not used_c[j]:
+            matched_indices[k, 0] = i
+            matched_indices[k, 1] = j
+            used_r[i] = True
+            used_c[j] = True
+            k += 1
+    return matched_indices[:k]
+
+
+match_greedy = njit(cache=True)(_match_greedy) if njit is not None else None
+
+
+def comparing_positions(self, positions1, positions2, positions1_cat, positions2_cat, max_diff):
+    M = positions1.shape[0]  # M pos1 (tracks)
+    N = positions2.shape[0]  # N pos2 (detections)
+
+    if M == 0 or N == 0:  # first frame, or nothing left to match against
+        return np.empty((0, 2), np.int32), list(range(M)), list(range(N))
+
+    if not self.hungarian and match_greedy is not None:
+        matched_indices = match_greedy(positions1, positions2, positions1_cat, positions2_cat,
+                                       max_diff.astype(np.float64) ** 2)
+    else:
+        # |a - b|^2 = |a|^2 + |b|^2 - 2a.b, in float64 so the cancellation error stays far below the gates
+        p1 = positions1.astype(np.float64)
+        p2 = positions2.astype(np.float64)
+        dist = (p2 * p2).sum(1)[:, None] + (p1 * p1).sum(1)[None, :] - 2 * (p2 @ p1.T)  # N x M squared distance
+        max_diff = max_diff.astype(np.float64) ** 2  # gate on squared distance, no sqrt needed
+        invalid = (dist > max_diff[:, None]) | np.not_equal.outer(positions2_cat, positions1_cat)  # N x M
         if self.hungarian:
-            dist[dist > 1e18] = 1e18
-            matched_indices = linear_sum_assignment(copy.deepcopy(dist))
+            dist = np.sqrt(np.maximum(dist, 0))  # hungarian minimises the total distance in meter
+            # one finite sentinel cost for gated pairs, small enough not to swamp the real distances
+            dist = np.where(invalid, 1e9, dist)
+            row_ind, col_ind = linear_sum_assignment(dist)
+            matched_indices = np.stack([row_ind, col_ind], axis=1)
+            gated = dist[row_ind, col_ind] >= 1e9  # forced pairs hungarian had to take
         else:
-            matched_indices = greedy_assignment(copy.deepcopy(dist))
-    else:  # first few frame
-        assert M == 0
-        matched_indices = np.array([], np.int32).reshape(-1, 2)
+            matched_indices = greedy_assignment(np.where(invalid, 1e18, dist))
 
-    unmatched_positions1_data = [d for d in range(positions1.shape[0]) if not (d in matched_indices[:, 1])]
-    unmatched_positions2_data = [d for d in range(positions2.shape[0]) if not (d in matched_indices[:, 0])]
+    mask1 = np.ones(positions1.shape[0], bool)
+    mask1[matched_indices[:, 1]] = False
+    unmatched_positions1_data = np.flatnonzero(mask1).tolist()
+    mask2 = np.ones(positions2.shape[0], bool)
+    mask2[matched_indices[:, 0]] = False
+    unmatched_positions2_data = np.flatnonzero(mask2).tolist()
 
     if self.hungarian:
-        matches = []
-        for m in matched_indices:
-            if dist[m[0], m[1]] > 1e16:
-                unmatched_positions2_data.append(m[0])
-            else:
-                matches.append(m)
-        matches = np.array(matches).reshape(-1, 2)
+        unmatched_positions2_data.extend(matched_indices[gated, 0].tolist())
+        matches = matched_indices[~gated]
     else:
         matches = matched_indices
     return matches, unmatched_positions1_data, unmatched_positions2_data
@@ -101,14 +203,6 @@ WAYMO_CLS_VELOCITY_ERROR = {
 }
 
 
-# reshape hungarians output to match the greedy output shape
-def reshape(hungarian):
-    result = np.empty((0, 2), int)
-    for i in range(len(hungarian[0])):
-        result = np.append(result, np.array([[hungarian[0][i], hungarian[1][i]]]), axis=0)
-    return result
-
-
 class PubTracker(object):
     def __init__(self, hungarian=False, max_age=6, noise=0.05, active_th=1, min_hits=1, score_update=None,
                  deletion_th=0.0, detection_th=0.0, dataset='Nuscenes', use_vel=False, tracker=None):
@@ -131,6 +225,19 @@ class PubTracker(object):
         elif dataset == 'Waymo':
             self.velocity_error = WAYMO_CLS_VELOCITY_ERROR
             self.tracking_names = WAYMO_TRACKING_NAMES
+        self._name_to_idx = {n: i for i, n in enumerate(self.tracking_names)}  # class name -> label_preds
+        self._name_to_idx_set = set(self.tracking_names)
+
+        # tracker type and use_vel are fixed for the tracker's lifetime, so pick the variants once here
+        self._use_kf = self.tracker == 'KF'
+        if self.tracker == 'PointTracker':
+            self._predict = self._predict_point_tracker
+        elif self.tracker == 'KF':
+            self._predict = self._predict_kf
+        if use_vel:
+            self._kf_H, self._kf_R, self._kf_measure = _H4, _R4, self._kf_measure_vel
+        else:
+            self._kf_H, self._kf_R, self._kf_measure = _H2, _R2, self._kf_measure_pos
         self.id_count = 0
         self.tracks = []
 
@@ -139,6 +246,112 @@ class PubTracker(object):
     def reset(self):
         self.id_count = 0
         self.tracks = []
+        # per-tracklet arrays kept across frames, slot i belongs to self.tracks[i];
+        # only the first self._size rows are valid, the capacity grows by doubling
+        self._size = 0
+        self._labels = np.empty(64, np.int32)  # class ids
+        self._ct = np.empty((64, 2), np.float32)  # 2d centerpoints
+        kf_capacity = 64 if self._use_kf else 0  # the PointTracker never touches the KF arrays
+        self._kf_x = np.empty((kf_capacity, 6), np.float64)  # KF states [x, y, vx, vy, ax, ay]
+        self._kf_P = np.empty((kf_capacity, 6, 6), np.float64)  # KF covariances
+
+    @property
+    def track_labels(self):
+        return self._labels[:self._size]  # M class ids
+
+    @property
+    def track_ct(self):
+        return self._ct[:self._size]  # M x 2
+
+    @property
+    def kf_x(self):
+        return self._kf_x[:self._size]  # M x 6
+
+    @property
+    def kf_P(self):
+        return self._kf_P[:self._size]  # M x 6 x 6
+
+    def _buffers(self):
+        return ('_labels', '_ct', '_kf_x', '_kf_P') if self._use_kf else ('_labels', '_ct')
+
+    def _reserve(self, size):
+        """grow the tracklet arrays (doubling) so that they hold at least size rows"""
+        capacity = self._ct.shape[0]
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in self._buffers():
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _set_tracks(self, tracks, head, new_ct, new_labels, tail):
+        """lay the arrays out like tracks: old slots head, then the new tracklets, then old slots tail"""
+        a, k = len(head), len(new_ct)
+        size = a + k + len(tail)
+        self._reserve(size)
+        idx = np.concatenate([head, tail]).astype(np.intp)
+        for name in self._buffers():
+            buf = getattr(self, name)
+            old = buf[idx]  # one gather, copies before anything is overwritten
+            buf[:a] = old[:a]
+            buf[a + k:size] = old[a:]
+        self._labels[a:a + k] = new_labels
+        self._ct[a:a + k] = new_ct
+        if self._use_kf:
+            for j in range(k):
+                _kf_init_state(tracks[a + j], self._kf_x[a + j])
+            self._kf_P[a:a + k] = _P0
+        self.tracks = tracks
+        self._size = size
+
+    def _init_track(self, det, active):
+        """turn a detection into a new tracklet with a fresh tracking id"""
+        self.id_count += 1
+        # extend tracklet with the following attributes:
+        det['tracking_id'] = self.id_count  # tracklet id
+        det['age'] = 1  # how many frames without matching detection (i.e. inactivity)
+        det['active'] = active
+        return det
+
+    def _predict_point_tracker(self, det_ct, det_tracking, time_lag):
+        # dets: estmated 2d centerpoint of a detection in the previous frame (ct + expected offset)
+        return self.track_ct, det_ct + det_tracking  # M x 2, N x 2
+
+    def _predict_kf(self, det_ct, det_tracking, time_lag):
+        self._kf_predict(time_lag)
+        # x[:, :2] is a strided view into the M x 6 states, gather it into one contiguous float32 block
+        # so the matching kernel sees the same layout and dtype as the PointTracker positions
+        return np.ascontiguousarray(self.kf_x[:, :2], np.float32), det_ct  # M x 2, N x 2
+
+    def _kf_measure_pos(self, det_ct, det_vel, idx):
+        return det_ct[idx]  # K x 2
+
+    def _kf_measure_vel(self, det_ct, det_vel, idx):
+        return np.hstack([det_ct[idx], det_vel[idx]])  # K x 4
+
+    def _kf_predict(self, time_lag):
+        """predict all tracklets at once: x = F x, P = F P F^T + Q"""
+        F = _build_F(time_lag)
+        x, P = self.kf_x, self.kf_P
+        x[:] = x @ F.T
+        P[:] = np.einsum('ij,mjk,lk->mil', F, P, F) + _Q
+
+    def _kf_update(self, idx, z):
+        """correct the tracklets idx with their measurements z (K x 2, or K x 4 if use_vel)"""
+        H, R = self._kf_H, self._kf_R
+        x, P = self.kf_x[idx], self.kf_P[idx]
+        y = z - x @ H.T  # K x dim_z residuals
+        PHT = P @ H.T
+        S = H @ PHT + R
+        K = np.linalg.solve(S, PHT.transpose(0, 2, 1)).transpose(0, 2, 1)  # P H^T S^-1, S is symmetric
+        x = x + (K @ y[..., None])[..., 0]
+        I_KH = _I6 - K @ H
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ R @ K.transpose(0, 2, 1)  # Joseph form, as filterpy
+        self.kf_x[idx] = x
+        self.kf_P[idx] = P
 
     def step_centertrack(self, results, time_lag):
         """
@@ -153,148 +366,98 @@ class PubTracker(object):
                  if train_data true than also return the training data
         """
 
+        use_kf = self._use_kf
+
         # if no detection in this frame, reset tracks list
         if len(results) == 0:
             self.tracks = []  # <-- however, this means, all tracklets are gone (i.e. 'died')
+            self._size = 0
             return []
 
         # if any detection is found, ...
         else:
             temp = []
+            det_labels = []  # N detection class ids
+            det_max_diff = []  # N per-class matching thresholds
+            det_ct = []  # N 2d centerpoints
+            det_tracking = []  # N expected offsets (PointTracker only)
+            det_vel = []  # N 2d velocities (KF only)
             for det in results:  # for each detection ...
                 # filter out classes not evaluated for tracking
-                if det['detection_name'] not in self.tracking_names:
+                if det['detection_name'] not in self._name_to_idx_set:
                     continue
                 # for all evaluated classes, extend with the following attributes
                 det['ct'] = np.array(det['translation'][:2])  # ct: 2d centerpoint of one detection
-                if self.tracker == 'PointTracker':
+                if not use_kf:
                     det['tracking'] = np.array(det['velocity'][:2]) * -1 * time_lag
+                    det_tracking.append(det['tracking'])
+                else:
+                    det_vel.append(det['velocity'][:2])
                 # label_preds: class id (instead of class name)
-                det['label_preds'] = self.tracking_names.index(det['detection_name'])
+                det['label_preds'] = self._name_to_idx[det['detection_name']]
                 temp.append(det)
+                det_labels.append(det['label_preds'])
+                det_max_diff.append(self.velocity_error[det['detection_name']])
+                det_ct.append(det['ct'])
 
             results = temp  # contains all extended resources
+            det_labels = np.asarray(det_labels, np.int32)
+            det_max_diff = np.asarray(det_max_diff, np.float32)
+            det_ct64 = np.asarray(det_ct, np.float64).reshape(-1, 2)  # full precision for the KF measurements
+            det_ct = det_ct64.astype(np.float32)
+            det_vel = np.asarray(det_vel, np.float64).reshape(-1, 2)
+            det_tracking = np.asarray(det_tracking, np.float32).reshape(-1, 2)
 
         N = len(results)  # number of resources in this frame
         M = len(self.tracks)  # number of tracklets
-        ret = []  # initiate return value (will become the updated tracklets list)
 
         # if no tracklet exist just yet (i.e. processing the first frame)
         if M == 0:
             for result in results:  # for each (extended) detection
-                # initiate new tracklet
-                track = result
-                self.id_count += 1
-                # extend tracklet with the following attributes:
-                track['tracking_id'] = self.id_count  # tracklet id
-                track['age'] = 1  # how many frames without matching detection (i.e. inactivity)
-                track['active'] = self.min_hits  # currently matched? (start with 1)
+                # initiate new tracklet, currently matched (start with min_hits)
+                self._init_track(result, self.min_hits)
                 # if track['detection_score'] > self.active_th:
                 #     track['active'] = self.min_hits
                 # else:
                 #     track['active'] = 0
-                if self.tracker == 'KF':
-                    if self.use_vel:
-                        track['KF'] = KalmanFilter(6, 4)
-                        track['KF'].H = np.array([[1., 0., 0., 0., 0., 0.],
-                                                  [0., 1., 0., 0., 0., 0.],
-                                                  [0., 0., 1., 0., 0., 0.],
-                                                  [0., 0., 0., 1., 0., 0.]])
-                    else:
-                        track['KF'] = KalmanFilter(6, 2)
-                        track['KF'].H = np.array([[1., 0., 0., 0., 0., 0.],
-                                                  [0., 1., 0., 0., 0., 0.]])
-                    track['KF'].x = np.hstack([track['ct'], np.array(track['velocity'][:2]), np.zeros(2)])
-                    track['KF'].P *= 10
-                ret.append(track)
-            self.tracks = ret
-            return ret
+            self._set_tracks(results, [], det_ct, det_labels, [])
+            return self.tracks
 
         # Processing from the second frame
-        if self.tracker == 'PointTracker':
-            # N X 2
-            # dets: estmated 2d centerpoint of a detection in the previous frame (ct + expected offset)
-            if 'tracking' in results[0]:
-                dets = np.array(
-                    [det['ct'].astype(np.float32) + det['tracking'].astype(np.float32)
-                     for det in results], np.float32)
-
-
-
-            else:
-                dets = np.array(
-                    [det['ct'] for det in results], np.float32)
-
-            tracks = np.array(
-                [pre_det['ct'] for pre_det in self.tracks], np.float32)  # M x 2
-
-        elif self.tracker == 'KF':
-            dets = np.array(
-                [det['ct'] for det in results], np.float32)
-
-            tracks = []
-            for tracklet in self.tracks:
-                tracklet['KF'].predict(F=np.array([[1, 0, time_lag, 0, time_lag * time_lag, 0],
-                                                   [0, 1, 0, time_lag, 0, time_lag * time_lag],
-                                                   [0, 0, 1, 0, time_lag, 0],
-                                                   [0, 0, 0, 1, 0, time_lag],
-                                                   [0, 0, 0, 0, 1, 0],
-                                                   [0, 0, 0, 0, 0, 1]]))
-                tracks.append(tracklet['KF'].x[:2])
-
-            tracks = np.array(tracks, np.float32)  # M x 2
+        tracks, dets = self._predict(det_ct, det_tracking, time_lag)
 
         # matching the current with the estimated pass
-        matching = comparing_positions(self, self.tracks, results, tracks, dets)
+        matching = comparing_positions(self, tracks, dets, self.track_labels, det_labels, det_max_diff)
         matched, unmatched_trk, unmatched_det = matching[0], matching[1], matching[2]
 
+        # correct the matched tracklets with their detections in one batch
+        if use_kf and len(matched) > 0:
+            self._kf_update(matched[:, 1], self._kf_measure(det_ct64, det_vel, matched[:, 0]))
+
         # add matches
+        ret = []  # initiate return value (will become the updated tracklets list)
         for m in matched:
             # initiate new tracklet (with three additional attributes)
             track = results[m[0]]
             track['tracking_id'] = self.tracks[m[1]]['tracking_id']  # tracklet id = id of matched trackled
             track['age'] = 1  # how many frames without matching detection (i.e. inactivity)
             track['active'] = self.tracks[m[1]]['active'] + 1
-            if self.tracker == 'KF':
-                track['KF'] = self.tracks[m[1]]['KF']
-                if self.use_vel:
-                    track['KF'].update(z=np.hstack([track['ct'], np.array(track['velocity'][:2])]))
-                else:
-                    track['KF'].update(z=track['ct'])
-                track['translation'][0] = track['KF'].x[0]
-                track['translation'][1] = track['KF'].x[1]
-                track['velocity'][0] = track['KF'].x[2]
-                track['velocity'][1] = track['KF'].x[3]
+            if use_kf:
+                x = self.kf_x[m[1]]
+                track['translation'][0] = x[0]
+                track['translation'][1] = x[1]
+                track['velocity'][0] = x[2]
+                track['velocity'][1] = x[3]
             ret.append(track)
+        self.track_ct[matched[:, 1]] = det_ct[matched[:, 0]]  # class ids already agree (gated on them)
 
         # add unmatched resources as new 'born' tracklets
         for i in unmatched_det:
-            track = results[i]
-            self.id_count += 1
-            track['tracking_id'] = self.id_count
-            track['age'] = 1
-            track['active'] = 1
-            if self.tracker == 'KF':
-                if self.use_vel:
-                    track['KF'] = KalmanFilter(6, 4)
-                    track['KF'].H = np.array([[1., 0., 0., 0., 0., 0.],
-                                              [0., 1., 0., 0., 0., 0.],
-                                              [0., 0., 1., 0., 0., 0.],
-                                              [0., 0., 0., 1., 0., 0.]])
-                else:
-                    track['KF'] = KalmanFilter(6, 2)
-                    track['KF'].H = np.array([[1., 0., 0., 0., 0., 0.],
-                                              [0., 1., 0., 0., 0., 0.]])
-                track['KF'].x = np.hstack([track['ct'], np.array(track['velocity'][:2]), np.zeros(2)])
-                track['KF'].P *= 10
-            if track['detection_score'] > self.det_th:
-                track['active'] = 1
-            else:
-                track['active'] = 0
-            ret.append(track)
+            ret.append(self._init_track(results[i], 1 if results[i]['detection_score'] > self.det_th else 0))
 
         # still store unmatched tracks if its age doesn't exceed max_age, 
         # however, we shouldn't output the object in current frame
+        kept_trk = []
         for i in unmatched_trk:
             track = self.tracks[i]
 
@@ -312,16 +475,20 @@ class PubTracker(object):
                     track['active'] = 0
 
                 ct = track['ct']
-                if 'tracking' in track:
+                if not use_kf:
                     offset = track['tracking'] * -1  # move forward
                     track['ct'] = ct + offset
                     track['translation'][:2] = track['ct']
-                elif 'KF' in track:
-                    track['translation'][0] = track['KF'].x[0]
-                    track['translation'][1] = track['KF'].x[1]
-                    track['velocity'][0] = track['KF'].x[2]
-                    track['velocity'][1] = track['KF'].x[3]
+                    self.track_ct[i] = track['ct']
+                else:
+                    x = self.kf_x[i]
+                    track['translation'][0] = x[0]
+                    track['translation'][1] = x[1]
+                    track['velocity'][0] = x[2]
+                    track['velocity'][1] = x[3]
                 ret.append(track)
+                kept_trk.append(i)
 
-        self.tracks = ret
-        return ret
\ No newline at end of file
+        # same slot order as ret: matched, new, kept; tracklets of forced hungarian pairs are dropped
+        self._set_tracks(ret, matched[:, 1], det_ct[unmatched_det], det_labels[unmatched_det], kept_trk)
+        return self.tracks
\ No newline at end of file